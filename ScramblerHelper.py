@@ -1,6 +1,9 @@
 from scipy import signal as sg
+from scipy import fft as sfft
 import numpy as np
-import matplotlib.pyplot as plt
+import librosa as lb
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 standard_carriers = [2632, 2718, 2868, 3023, 3196, 3339, 3495, 3729]
 
@@ -20,6 +23,9 @@ def getfilts(n, fs):
 
 def specshow(D, hl, sr):
     
+    # matplotlib is slow to import and only needed for plotting
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(nrows=1, ncols=1, sharex=True)
 
 
@@ -35,60 +41,133 @@ def bandspec(xs, hl):
     step = int(hl/n)
     
     f = [(i*step, ((i+1) * step) - 1) for i in range(n)]
-    bands = [spectrum(x, hl)[f[i][0]:f[i][1]] for i, x in enumerate(xs)]
+    # one batched stft over all bands instead of one per band
+    D = spectrum(np.asarray(xs), hl)
+    bands = [D[i, f[i][0]:f[i][1]] for i in range(n)]
     
     return bands
     
 def spectrum(x, hl):
     
-    return np.abs(lb.stft(x, hop_length=hl))
+    # librosa's stft goes through scipy.fft; let it use every core
+    with sfft.set_workers(-1):
+        return np.abs(lb.stft(x, hop_length=hl))
 
-def remove_dc(signal):
-    signal = signal - np.mean(signal)
+def remove_dc(signal, out=None):
+    signal = np.subtract(signal, np.mean(signal), out=out)
 
     return signal
     
+# cached SOS arrays are shared between callers and must not be modified in place
+@functools.lru_cache(maxsize=32)
 def lpfilter(cutoff, fs):
-    f = sg.cheby1(5, 4, cutoff, 'lowpass', output='sos', fs=fs)
+    # float32 coefficients keep sosfilt on its single precision path
+    f = sg.cheby1(5, 4, cutoff, 'lowpass', output='sos', fs=fs).astype(np.float32)
     
     return f
     
 def invert(signal, carrier, filt):
 
-    prefilter = sg.sosfilt(filt, signal)
     inv_signal = signal * carrier
     postfilter = sg.sosfilt(filt, inv_signal)
     
     return postfilter
 
+def invert_bands(bands, carriers, filts, out=None):
+    
+    # multiply every band by its carrier in one op (into out if given), then
+    # run one sosfilt per distinct filter over all the bands that share it
+    inv_bands = np.multiply(bands, carriers, out=out)
+    groups = {}
+    for i, f in enumerate(filts):
+        groups.setdefault(f.tobytes(), []).append(i)
+
+    def filter_rows(rows):
+        if len(rows) == 1:
+            # index a lone band directly so it is read as a view, not gathered
+            # into a copy; sosfilt still returns its own filtered array
+            r = rows[0]
+            inv_bands[r] = sg.sosfilt(filts[r], inv_bands[r])
+        else:
+            inv_bands[rows] = sg.sosfilt(filts[rows[0]], inv_bands[rows], axis=-1)
+
+    # bands are independent and sosfilt releases the GIL, so filter them on
+    # separate threads when there is more than one filter to run
+    if len(groups) == 1:
+        filter_rows(next(iter(groups.values())))
+    else:
+        with ThreadPoolExecutor() as pool:
+            list(pool.map(filter_rows, groups.values()))
+    
+    return inv_bands
+
 def carrier(f, t):
     
     return np.sin(f * (2 * np.pi) * t)
 
 def generate_carriers(num_bands, t):
-    carriers = []
-    for i in range(0, num_bands):
-        n = i % len(standard_carriers)
-        carriers.append(carrier(standard_carriers[n], t))
+    # the carrier table only depends on the band count and the sampling grid
+    t0 = float(t[0]) if len(t) > 0 else 0.0
+    dt = float(t[1] - t[0]) if len(t) > 1 else 0.0
+
+    return carrier_table(num_bands, len(t), t0, dt)
+
+@functools.lru_cache(maxsize=32)
+def carrier_table(num_bands, n, t0, dt):
+    # one row per band, all computed in a single broadcast
+    freqs = np.asarray([standard_carriers[i % len(standard_carriers)] for i in range(num_bands)], dtype=np.float64)
+    
+    # split sample index m into m = k * block + j and use
+    # sin(w(kB + j)) = sin(wkB) cos(wj) + cos(wkB) sin(wj)
+    # so each band only needs about 2 * sqrt(n) sin/cos evaluations,
+    # everything else is multiply-adds
+    block = max(1, int(np.ceil(np.sqrt(n))))
+    num_blocks = -(-n // block)
+    w = (2 * np.pi * dt) * freqs[:, None]
+    inner = w * np.arange(block)
+    outer = w * (np.arange(num_blocks) * block) + (2 * np.pi * t0) * freqs[:, None]
+    
+    carriers = np.empty((num_bands, num_blocks, block))
+    np.multiply(np.sin(outer)[:, :, None], np.cos(inner)[:, None, :], out=carriers)
+    carriers += np.cos(outer)[:, :, None] * np.sin(inner)[:, None, :]
+    carriers = carriers.reshape(num_bands, -1)[:, :n].astype(np.float32)
+    carriers.flags.writeable = False
 
     return carriers
 
+@functools.lru_cache(maxsize=32)
 def generate_lpfilters(num_bands, fs):
     lpfilters = []
     for i in range(0, num_bands):
         n = i % len(standard_carriers)
         lpfilters.append(lpfilter(standard_carriers[n], fs))
 
-    return lpfilters
+    return tuple(lpfilters)
 
 def digfreq(f, fs):
     return (2 * np.pi * f) / fs
 
+@functools.lru_cache(maxsize=32)
+def bandmasks(n, num_bands, fs):
+    # brick-wall masks on the rfft grid of an n sample signal, using the same
+    # band edges as getfilts; every bin belongs to exactly one band so the
+    # bands add back up to the original signal
+    freqs = sfft.rfftfreq(n, 1 / fs)
+    step = int((fs / 2) / num_bands)
+    band = np.minimum(freqs // step, num_bands - 1)
+    masks = (band[None, :] == np.arange(num_bands)[:, None]).astype(np.float32)
+    masks.flags.writeable = False
+
+    return masks
+
 def bandsplit(signal, num_bands, fs):
     
-    filts = getfilts(num_bands, fs)    
-    bands = [sg.sosfilt(f, signal) for f in filts]    
-    bands = bandspec(bands, 1024)
+    # filter every band at once in the frequency domain: one forward fft,
+    # one batched multiply and one batched inverse fft
+    n = len(signal)
+    masks = bandmasks(n, num_bands, fs)
+    X = sfft.rfft(signal, workers=-1)
+    bands = sfft.irfft(masks * X[None, :], n=n, axis=-1, workers=-1)
     
     return bands
 
@@ -98,4 +177,5 @@ def shuffle(bands, book):
 
 def bandunsplit(bands):
     
-    return np.vstack(bands)
+    # bands is already a (bands, N) array, so recombine with one reduction
+    return np.sum(bands, axis=0)
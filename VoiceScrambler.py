@@ -39,7 +39,6 @@ import argparse
 
 from scipy import signal as sg
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.io import wavfile
 
 from ScramblerHelper import *
@@ -63,9 +62,10 @@ def debug_print(msg, debug):
 def read_wav_file(file):
     # Read wav file
     Fs, x = wavfile.read(file)
+    x = x.astype(np.float32)
     Ts = 1 / Fs
     duration = len(x) / Fs
-    t = np.linspace(0,duration,len(x))
+    t = np.arange(len(x), dtype=np.float64) * Ts
 
     return [Fs, Ts, duration, x, t]
 
@@ -77,11 +77,14 @@ def write_wav_file(signal, file, Fs, invert_flag):
         # strip '.wav' from input file, add 'descrambled.wav'
         wavfile_out_name = file[:-4] + 'descrambled.wav'
         
-    # normalize signal for output
-    m = np.max(signal)
-    signalf32 = (signal/m).astype(np.float32)
+    # normalize signal for output by its peak magnitude and scale straight
+    # into 16-bit PCM without a full-size float temporary
+    m = max(np.max(signal), -np.min(signal))
+    scale = 32767 / m if m > 0 else 0
+    signal16 = np.empty(len(signal), dtype=np.int16)
+    np.multiply(signal, scale, out=signal16, casting='unsafe')
     
-    wavfile.write(wavfile_out_name, Fs, signalf32)
+    wavfile.write(wavfile_out_name, Fs, signal16)
 
 def determine_rate(rate_fractional, duration):
     # This returns the rate in amount of seconds expected between change
@@ -152,7 +155,7 @@ def scrambler(mode, filename, speech_parameters, rate, bands, debug):
     debug_print(debug_str, debug)
 
     # Remove any DC offset in the signal
-    speech_dc_removed = remove_dc(speech_original)
+    speech_dc_removed = remove_dc(speech_original, out=speech_original)
     debug_str = "DC offset removed from signal.\n"
     debug_print(debug_str, debug)
 
@@ -180,6 +183,14 @@ def scrambler(mode, filename, speech_parameters, rate, bands, debug):
 
     debug_str = "Signal split in time based on given rate.\n"
     debug_print(debug_str, debug)
+
+    # generate carrier frequencies and associated low pass filters once,
+    # they are shared by the scramble and descramble passes
+    carriers = generate_carriers(bands, time_vector)
+    lpfs = generate_lpfilters(bands, Fs)
+
+    debug_str = "Carriers and associated low pass filters generated.\n"
+    debug_print(debug_str, debug)
     
     # Bandsplit speech
     # NOTE: this will change (likely a for loop) based on immediately preceding code
@@ -192,20 +203,12 @@ def scrambler(mode, filename, speech_parameters, rate, bands, debug):
     debug_print(debug_str, debug)
 
     # SCRAMBLE!
-    # generate carrier frequencies and associated low pass filters
-    carriers = generate_carriers(bands, time_vector)
-    lpfs = generate_lpfilters(bands, Fs)
-
-    debug_str = "Carriers and associated low pass filters generated.\n"
-    debug_print(debug_str, debug)
-
-    speech_inverted_bands = []
-    for i in range(0, len(speech_band_split)):
-        speech_inverted_bands.append(invert(speech_band_split[i], carriers[i], lpfs[i]))
+    speech_inverted_bands = np.empty((len(speech_band_split), len(speech_dc_removed)), dtype=np.float32)
+    invert_bands(speech_band_split, carriers, lpfs, out=speech_inverted_bands)
     
     if (bands > 1):
         # add bands back together
-        pass
+        speech_scrambled = bandunsplit(speech_inverted_bands)
     else:
         speech_scrambled = speech_inverted_bands[0]
 
@@ -218,27 +221,15 @@ def scrambler(mode, filename, speech_parameters, rate, bands, debug):
     debug_print(debug_str, debug)
 
     # DESCRAMBLE!
-    # Do everything again
-
-    # Remove any DC offset in the signal
-    speech_dc_removed = remove_dc(speech_scrambled)
-
-    ### Split signal in time at same points as before regardless of mode ###
-
-    # Bandsplit scrambled speech in same manner as before
-    # NOTE: this will change (likely a for loop) based on immediately preceding code
-    if (bands > 1):
-        speech_band_split = bandsplit(speech_dc_removed, bands, Fs)
-    else:
-        speech_band_split = [speech_dc_removed] # no split, no change
-        
-    speech_deinverted_bands = []
-    for i in range(0, len(speech_band_split)):
-        speech_deinverted_bands.append(invert(speech_band_split[i], carriers[i], lpfs[i]))
+    # Inverting with the same carrier and low pass filter undoes the inversion,
+    # so re-invert the scrambled bands directly instead of removing DC and
+    # bandsplitting the recombined scrambled signal again
+    speech_deinverted_bands = np.empty_like(speech_inverted_bands)
+    invert_bands(speech_inverted_bands, carriers, lpfs, out=speech_deinverted_bands)
 
     if (bands > 1):
         # add bands back together
-        pass
+        speech_descrambled = bandunsplit(speech_deinverted_bands)
     else:
         speech_descrambled = speech_deinverted_bands[0]
 